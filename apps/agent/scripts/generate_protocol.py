@@ -1,6 +1,7 @@
 """Generate protocol types from JSON schemas."""
 
 import subprocess
+import sys
 from pathlib import Path
 
 
@@ -12,8 +13,9 @@ def main():
 
     output_dir.mkdir(exist_ok=True)
 
+    # server_to_agent.py is maintained by hand: the inbound commands are msgspec
+    # Structs tagged on "type", which datamodel-codegen cannot emit.
     schemas = [
-        ("server-to-agent.json", "server_to_agent.py"),
         ("agent-to-server.json", "agent_to_server.py"),
     ]
 
@@ -33,6 +35,10 @@ def main():
             check=True,
         )
 
+    # Importing the package builds the msgspec decoder for the inbound union
+    print("Checking protocol package imports...")
+    subprocess.run([sys.executable, "-c", "import protocol"], cwd=root / "src", check=True)
+
     print("Done!")
 
 
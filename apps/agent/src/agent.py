@@ -11,76 +11,262 @@ Simplified single-turn pattern using query() function:
 """
 
 import asyncio
-import json
+import dataclasses
+import logging
 import os
 import sys
 
+import msgspec
 from claude_agent_sdk import query, ClaudeAgentOptions, ResultMessage, SystemMessage, ProcessError
 
 from protocol import (
+    ServerToAgentMessage,
+    ProcessStartCommand,
+    SessionMessageCommand,
+    TextContent,
     AgentToServerMessage,
     ProcessReadyEvent,
     ProcessErrorEvent,
-    ProcessStoppedEvent,
     SessionStartedEvent,
     SessionCompleteEvent,
     SessionErrorEvent,
     ResultData,
-    is_process_start,
-    is_session_message,
+    PROCESS_STOPPED_STOP,
+    PROCESS_STOPPED_ERROR,
+    ERROR_EXPECTED_PROCESS_START,
+    ERROR_EXPECTED_SESSION_MESSAGE,
+    session_complete_template,
+    DECODER,
+    ENCODER,
 )
 
 
+logger = logging.getLogger("agent")
+
+# Session-independent options; run() fills in workspace and resume settings
+_BASE_OPTIONS = ClaudeAgentOptions(
+    allowed_tools=["Read", "Write", "Edit", "Bash", "Grep", "Glob"],
+    permission_mode="bypassPermissions",
+    setting_sources=["user"],
+)
+
+
+def setup_logging() -> None:
+    """Send agent logs to stderr."""
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(logging.Formatter("[AGENT] %(levelname)s: %(message)s"))
+    logger.addHandler(stream)
+    # getLevelName() maps known names to ints; fall back on anything else
+    level = logging.getLevelName(os.environ.get("AGENT_LOG_LEVEL", "WARNING").upper())
+    logger.setLevel(level if isinstance(level, int) else logging.WARNING)
+    logger.propagate = False
+
+
+# os.writev() fails with EINVAL above this many buffers (16 is the POSIX floor)
+_IOV_MAX = max(os.sysconf("SC_IOV_MAX"), 16)
+
+
 def emit(msg: AgentToServerMessage) -> None:
     """Emit JSON message to stdout."""
-    print(json.dumps(msg), flush=True)
+    emit_raw(ENCODER.encode(msg) + b"\n")
+
+
+def emit_raw(payload: bytes) -> None:
+    """Write a pre-serialized message to stdout."""
+    # stdout is a pipe, so a large payload may be written in parts
+    view = memoryview(payload)
+    while view:
+        view = view[os.write(1, view):]
+
+
+# Queued for JSON lines that are not a valid command. Unlike None (EOF or
+# malformed JSON) it lets the handshake report the unexpected message.
+INVALID_MESSAGE = object()
+
+
+class StdinProtocol(asyncio.BufferedProtocol):
+    """Parse newline-delimited JSON from stdin into a queue.
+
+    Transports that support buffered protocols (uvloop) read straight into
+    the buffer returned by get_buffer(). The stock asyncio pipe transport
+    only calls data_received(), which copies into the same buffer.
+    """
+
+    __slots__ = ("_queue", "_buf", "_end")
+
+    def __init__(self, queue: asyncio.Queue[ServerToAgentMessage | object | None]):
+        self._queue = queue
+        self._buf = bytearray(65536)
+        self._end = 0
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        if self._end == len(self._buf):
+            # Line longer than the buffer, grow it
+            self._buf = self._buf + bytearray(len(self._buf))
+        return memoryview(self._buf)[self._end:]
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self._end += nbytes
+        buf = self._buf
+        start = 0
+        while (end := buf.find(b"\n", start, self._end)) != -1:
+            self._put_line(memoryview(buf)[start:end])
+            start = end + 1
+        if start:
+            # Move the partial line to the front
+            remaining = self._end - start
+            buf[:remaining] = buf[start:self._end]
+            self._end = remaining
+
+    def data_received(self, data: bytes) -> None:
+        end = self._end + len(data)
+        if end > len(self._buf):
+            self._buf = self._buf + bytearray(end - len(self._buf))
+        self._buf[self._end:end] = data
+        self.buffer_updated(len(data))
+
+    def eof_received(self) -> bool:
+        if self._end:
+            self._put_line(memoryview(self._buf)[:self._end])
+            self._end = 0
+        self._queue.put_nowait(None)
+        return False
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        if exc is not None:
+            self._queue.put_nowait(None)
+
+    def _put_line(self, line: memoryview) -> None:
+        try:
+            msg = DECODER.decode(line)
+        except msgspec.ValidationError:
+            msg = INVALID_MESSAGE
+        except msgspec.DecodeError:
+            msg = None
+        self._queue.put_nowait(msg)
 
 
 class Agent:
+    __slots__ = (
+        "workspace",
+        "current_session_id",
+        "got_result",
+        "_queue",
+        "_out_q",
+        "_handlers",
+        "_complete_tmpl",
+    )
+
     def __init__(self, workspace: str):
         self.workspace = workspace
-        self.reader: asyncio.StreamReader | None = None
+        self._queue: asyncio.Queue[ServerToAgentMessage | object | None] = asyncio.Queue()
+        self._out_q: asyncio.Queue[bytes | None] = asyncio.Queue()
+        self.current_session_id: str | None = None
+        self.got_result = False
+        self._complete_tmpl: bytes | None = None
+        # SDK message type -> handler; a truthy return ends the query loop
+        self._handlers = {
+            SystemMessage: self._on_system_message,
+            ResultMessage: self._on_result_message,
+            ProcessError: self._on_process_error,
+        }
 
     async def setup_stdin(self) -> None:
         """Setup async stdin reader."""
-        loop = asyncio.get_event_loop()
-        self.reader = asyncio.StreamReader()
-        await loop.connect_read_pipe(
-            lambda: asyncio.StreamReaderProtocol(self.reader),
-            sys.stdin
-        )
+        loop = asyncio.get_running_loop()
+        await loop.connect_read_pipe(lambda: StdinProtocol(self._queue), sys.stdin)
+
+    def emit(self, msg: AgentToServerMessage) -> None:
+        """Queue JSON message for the stdout writer task."""
+        self._out_q.put_nowait(ENCODER.encode(msg) + b"\n")
+
+    def emit_raw(self, payload: bytes) -> None:
+        """Queue a pre-serialized message for the stdout writer task."""
+        self._out_q.put_nowait(payload)
 
-    async def read_message(self) -> dict | None:
+    async def _write_output(self) -> None:
+        """Drain queued messages to stdout, one write per batch."""
+        queue = self._out_q
+        while True:
+            chunks = [await queue.get()]
+            while len(chunks) < _IOV_MAX and not queue.empty():
+                chunks.append(queue.get_nowait())
+            closed = chunks[-1] is None
+            if closed:
+                chunks.pop()
+            if chunks:
+                written = os.writev(1, chunks)
+                if written < sum(map(len, chunks)):
+                    emit_raw(b"".join(chunks)[written:])
+            if closed:
+                return
+
+    async def read_message(self) -> ServerToAgentMessage | object | None:
         """Read one message from stdin."""
-        try:
-            line = await self.reader.readline()
-            if not line:
-                return None
-            return json.loads(line.decode().strip())
-        except json.JSONDecodeError:
-            return None
-
-    def parse_content(self, msg: dict) -> str:
+        return await self._queue.get()
+
+    def parse_content(self, msg: SessionMessageCommand) -> str:
         """Parse message content to string."""
-        if "text" in msg:
-            return msg["text"]
-        if "content" in msg:
-            content = msg["content"]
-            if isinstance(content, str):
-                return content
-            # Handle content blocks
-            if isinstance(content, list):
-                texts = []
-                for block in content:
-                    if isinstance(block, dict) and block.get("type") == "text":
-                        texts.append(block.get("text", ""))
-                    elif isinstance(block, str):
-                        texts.append(block)
-                return "\n".join(texts)
+        if msg.text is not None:
+            return msg.text
+        if msg.content is not None:
+            # Only text blocks contribute to the prompt
+            return "\n".join([
+                block.text for block in msg.content if type(block) is TextContent
+            ])
         return ""
 
+    def _on_system_message(self, message: SystemMessage) -> bool:
+        # Init message contains session_id
+        if message.subtype == "init":
+            self.current_session_id = message.data.get("session_id")
+            if self.current_session_id is not None:
+                self._complete_tmpl = session_complete_template(self.current_session_id)
+            self.emit(SessionStartedEvent(
+                type="session_started",
+                session_id=self.current_session_id or "unknown"
+            ))
+        return False
+
+    def _on_result_message(self, message: ResultMessage) -> bool:
+        # Result message means complete
+        self.got_result = True
+        tmpl = self._complete_tmpl
+        if tmpl is None or message.session_id != self.current_session_id:
+            tmpl = session_complete_template(message.session_id)
+        self.current_session_id = message.session_id
+        self.emit_raw(tmpl % (
+            message.duration_ms,
+            message.duration_api_ms,
+            ENCODER.encode(message.total_cost_usd),
+            message.num_turns,
+        ))
+        # query() iterator will terminate after ResultMessage
+        return False
+
+    def _on_process_error(self, message: ProcessError) -> bool:
+        # Process error (e.g., billing error, API error)
+        self.emit(SessionErrorEvent(
+            type="session_error",
+            message=message.message
+        ))
+        return True
+
     async def run(self) -> None:
         """Main entry point."""
+        writer = asyncio.create_task(self._write_output())
+        session = asyncio.create_task(self._run_session())
+        # If stdout goes away there is no one to report to; stop the session
+        writer.add_done_callback(lambda _: session.cancel())
+        try:
+            await session
+        finally:
+            # Let the writer drain everything queued before it exits
+            self._out_q.put_nowait(None)
+            await writer
+
+    async def _run_session(self) -> None:
+        """Handle process_start, one session_message, and the query."""
         await self.setup_stdin()
 
         # Wait for process_start
@@ -88,24 +274,22 @@ class Agent:
         if msg is None:
             return
 
-        if not is_process_start(msg):
-            emit(ProcessErrorEvent(type="process_error", message="Expected process_start"))
+        if not isinstance(msg, ProcessStartCommand):
+            self.emit_raw(ERROR_EXPECTED_PROCESS_START)
             return
 
         # Create client options
-        resume_session_id = msg.get("session_id")
-        fork = msg.get("fork", False)
+        resume_session_id = msg.session_id
+        fork = bool(msg.fork)
 
-        options = ClaudeAgentOptions(
-            allowed_tools=["Read", "Write", "Edit", "Bash", "Grep", "Glob"],
-            permission_mode="bypassPermissions",
+        options = dataclasses.replace(
+            _BASE_OPTIONS,
             cwd=self.workspace,
             resume=resume_session_id,
             fork_session=fork,
-            setting_sources=["user"],
         )
 
-        emit(ProcessReadyEvent(
+        self.emit(ProcessReadyEvent(
             type="process_ready",
             workspace=self.workspace,
             session_id=resume_session_id or "pending",
@@ -115,58 +299,32 @@ class Agent:
 
         # Wait for session_message
         msg = await self.read_message()
-        if msg is None or not is_session_message(msg):
-            emit(ProcessErrorEvent(type="process_error", message="Expected session_message"))
+        if not isinstance(msg, SessionMessageCommand):
+            self.emit_raw(ERROR_EXPECTED_SESSION_MESSAGE)
             return
 
         # Parse prompt
         prompt = self.parse_content(msg)
 
         try:
-            current_session_id = resume_session_id
-            got_result = False
+            self.current_session_id = resume_session_id
+            self.got_result = False
+            dispatch = self._handlers.get
 
-            # Use query() function - it handles connection lifecycle automatically
+            # Use query() function - it handles connection lifecycle automatically.
+            # Events emitted during a burst of SDK messages are coalesced by the
+            # writer task, so each message only costs one handler lookup here.
             async for message in query(prompt=prompt, options=options):
-                # Init message contains session_id
-                if isinstance(message, SystemMessage) and message.subtype == "init":
-                    current_session_id = message.data.get("session_id")
-                    emit(SessionStartedEvent(
-                        type="session_started",
-                        session_id=current_session_id or "unknown"
-                    ))
-
-                # Result message means complete
-                elif isinstance(message, ResultMessage):
-                    got_result = True
-                    current_session_id = message.session_id
-                    result = ResultData(
-                        duration_ms=message.duration_ms,
-                        duration_api_ms=message.duration_api_ms,
-                        total_cost_usd=message.total_cost_usd,
-                        num_turns=message.num_turns,
-                    )
-                    emit(SessionCompleteEvent(
-                        type="session_complete",
-                        session_id=current_session_id,
-                        result=result
-                    ))
-                    # query() iterator will terminate after ResultMessage
-
-                # Process error (e.g., billing error, API error)
-                elif isinstance(message, ProcessError):
-                    emit(SessionErrorEvent(
-                        type="session_error",
-                        message=message.message
-                    ))
+                handler = dispatch(type(message))
+                if handler is not None and handler(message):
                     return
 
             # If query() ended without ResultMessage, emit completion anyway
-            if not got_result:
-                print(f"[AGENT] Warning: query() ended without ResultMessage", file=sys.stderr, flush=True)
-                emit(SessionCompleteEvent(
+            if not self.got_result:
+                logger.warning("query() ended without ResultMessage")
+                self.emit(SessionCompleteEvent(
                     type="session_complete",
-                    session_id=current_session_id or "unknown",
+                    session_id=self.current_session_id or "unknown",
                     result=ResultData(
                         duration_ms=0,
                         duration_api_ms=0,
@@ -178,13 +336,14 @@ class Agent:
         except asyncio.CancelledError:
             pass
         except Exception as e:
-            print(f"[AGENT] Exception: {e}", file=sys.stderr, flush=True)
-            emit(ProcessErrorEvent(type="process_error", message=str(e)))
+            logger.error("Exception: %s", e)
+            self.emit(ProcessErrorEvent(type="process_error", message=str(e)))
 
-        emit(ProcessStoppedEvent(type="process_stopped", reason="stop"))
+        self.emit_raw(PROCESS_STOPPED_STOP)
 
 
 async def main() -> None:
+    setup_logging()
     workspace = os.environ.get("WORKSPACE_DIR", os.getcwd())
 
     try:
@@ -192,8 +351,13 @@ async def main() -> None:
         await agent.run()
     except Exception as e:
         emit(ProcessErrorEvent(type="process_error", message=str(e)))
-        emit(ProcessStoppedEvent(type="process_stopped", reason="error"))
+        emit_raw(PROCESS_STOPPED_ERROR)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
@@ -1,7 +1,9 @@
-"""Agent protocol types - generated from JSON schemas."""
+"""Agent protocol types - generated events and hand-written msgspec commands."""
 
 from typing import TypeGuard
 
+import msgspec
+
 from .server_to_agent import (
     ServerToAgentMessage,
     ProcessStartCommand,
@@ -26,21 +28,55 @@ from .agent_to_server import (
 )
 
 
+# Shared JSON codec; decoding returns the tagged Struct for the message type
+DECODER = msgspec.json.Decoder(ServerToAgentMessage)
+ENCODER = msgspec.json.Encoder()
+
+
 # Type guards for message discrimination
 def is_process_start(msg: ServerToAgentMessage) -> TypeGuard[ProcessStartCommand]:
-    return msg.get("type") == "process_start"
+    return isinstance(msg, ProcessStartCommand)
 
 
 def is_session_message(msg: ServerToAgentMessage) -> TypeGuard[SessionMessageCommand]:
-    return msg.get("type") == "session_message"
+    return isinstance(msg, SessionMessageCommand)
 
 
 def is_session_interrupt(msg: ServerToAgentMessage) -> TypeGuard[SessionInterruptCommand]:
-    return msg.get("type") == "session_interrupt"
+    return isinstance(msg, SessionInterruptCommand)
 
 
 def is_process_stop(msg: ServerToAgentMessage) -> TypeGuard[ProcessStopCommand]:
-    return msg.get("type") == "process_stop"
+    return isinstance(msg, ProcessStopCommand)
+
+
+# Pre-serialized constant events (newline-terminated, ready to write)
+PROCESS_STOPPED_STOP = ENCODER.encode(
+    ProcessStoppedEvent(type="process_stopped", reason="stop")
+) + b"\n"
+PROCESS_STOPPED_ERROR = ENCODER.encode(
+    ProcessStoppedEvent(type="process_stopped", reason="error")
+) + b"\n"
+ERROR_EXPECTED_PROCESS_START = ENCODER.encode(
+    ProcessErrorEvent(type="process_error", message="Expected process_start")
+) + b"\n"
+ERROR_EXPECTED_SESSION_MESSAGE = ENCODER.encode(
+    ProcessErrorEvent(type="process_error", message="Expected session_message")
+) + b"\n"
+
+
+def session_complete_template(session_id: str) -> bytes:
+    """Pre-serialize a session_complete event for one session.
+
+    The result is a bytes %-format expecting duration_ms, duration_api_ms
+    and num_turns as integers and total_cost_usd as JSON-encoded bytes.
+    """
+    sid = ENCODER.encode(session_id).replace(b"%", b"%%")
+    return (
+        b'{"type":"session_complete","session_id":' + sid
+        + b',"result":{"duration_ms":%d,"duration_api_ms":%d,'
+        b'"total_cost_usd":%s,"num_turns":%d}}\n'
+    )
 
 
 __all__ = [
@@ -64,9 +100,18 @@ __all__ = [
     "SessionInterruptedEvent",
     "SessionErrorEvent",
     "ResultData",
+    # JSON codec
+    "DECODER",
+    "ENCODER",
     # Type guards
     "is_process_start",
     "is_session_message",
     "is_session_interrupt",
     "is_process_stop",
+    # Pre-serialized events
+    "PROCESS_STOPPED_STOP",
+    "PROCESS_STOPPED_ERROR",
+    "ERROR_EXPECTED_PROCESS_START",
+    "ERROR_EXPECTED_SESSION_MESSAGE",
+    "session_complete_template",
 ]
@@ -1,50 +1,47 @@
-# generated by datamodel-codegen:
-#   filename:  server-to-agent.json
+# Hand-written from server-to-agent.json; keep in sync with the schema.
+# Commands are msgspec Structs tagged on "type" so protocol.DECODER can decode
+# the ServerToAgentMessage union directly (not produced by generate-protocol).
 
 from __future__ import annotations
 
 from typing import Literal, TypeAlias
 
-from typing_extensions import NotRequired, TypedDict
+from msgspec import Struct
 
 
-class ProcessStartCommand(TypedDict, closed=True):
-    type: Literal['process_start']
-    session_id: NotRequired[str]
-    fork: NotRequired[bool]
+class ProcessStartCommand(Struct, tag_field='type', tag='process_start'):
+    session_id: str | None = None
+    fork: bool | None = None
 
 
-class TextContent(TypedDict, closed=True):
-    type: Literal['text']
+class TextContent(Struct, tag_field='type', tag='text'):
     text: str
 
 
-class ImageSource(TypedDict, closed=True):
+class ImageSource(Struct):
     type: Literal['base64', 'url']
     media_type: str
     data: str
 
 
-class ImageContent(TypedDict, closed=True):
-    type: Literal['image']
+class ImageContent(Struct, tag_field='type', tag='image'):
     source: ImageSource
 
 
 ContentBlock: TypeAlias = TextContent | ImageContent
 
 
-class SessionMessageCommand(TypedDict, closed=True):
-    type: Literal['session_message']
-    text: NotRequired[str]
-    content: NotRequired[list[ContentBlock]]
+class SessionMessageCommand(Struct, tag_field='type', tag='session_message'):
+    text: str | None = None
+    content: list[ContentBlock] | None = None
 
 
-class SessionInterruptCommand(TypedDict, closed=True):
-    type: Literal['session_interrupt']
+class SessionInterruptCommand(Struct, tag_field='type', tag='session_interrupt'):
+    pass
 
 
-class ProcessStopCommand(TypedDict, closed=True):
-    type: Literal['process_stop']
+class ProcessStopCommand(Struct, tag_field='type', tag='process_stop'):
+    pass
 
 
 ServerToAgentMessage: TypeAlias = (
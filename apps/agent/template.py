@@ -4,7 +4,7 @@ Claude Agent Sandbox Template
 Builds from Dockerfile with:
 - Ubuntu 22.04 base
 - Node.js 22 (for Claude Code CLI)
-- Python 3 with claude-agent-sdk
+- Python 3 with claude-agent-sdk, msgspec and uvloop
 - Agent code at /app/src
 
 Usage:
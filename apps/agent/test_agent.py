@@ -7,89 +7,85 @@ Usage:
     python test_agent.py
 """
 
-import subprocess
+import asyncio
 import json
-import sys
-import time
 
 
-def send(proc, msg: dict) -> None:
+async def send(proc: asyncio.subprocess.Process, msg: dict) -> None:
     """Send a message to the agent."""
     line = json.dumps(msg) + "\n"
     print(f">>> {msg}")
-    proc.stdin.write(line)
-    proc.stdin.flush()
+    proc.stdin.write(line.encode())
+    await proc.stdin.drain()
 
 
-def read_responses(proc, timeout: float = 30) -> None:
+async def read_responses(proc: asyncio.subprocess.Process, timeout: float = 30) -> None:
     """Read responses from the agent until timeout or process ends."""
-    import select
-
-    start = time.time()
-    while time.time() - start < timeout:
-        # Check if there's data to read (non-blocking)
-        if proc.stdout in select.select([proc.stdout], [], [], 0.1)[0]:
-            line = proc.stdout.readline()
-            if not line:
-                break
-            try:
-                msg = json.loads(line.strip())
-                print(f"<<< {msg}")
-
-                # Show session_id if available
-                if msg.get("type") == "session_complete":
-                    print(f"    (session complete)")
-                    return
-                if msg.get("type") == "process_stopped":
-                    return
-            except json.JSONDecodeError:
-                print(f"<<< (raw) {line.strip()}")
-
-        # Check if process ended
-        if proc.poll() is not None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        try:
+            line = await asyncio.wait_for(
+                proc.stdout.readline(), timeout=deadline - loop.time()
+            )
+        except asyncio.TimeoutError:
+            return
+        if not line:
             break
+        try:
+            msg = json.loads(line)
+            print(f"<<< {msg}")
 
+            # Show session_id if available
+            if msg.get("type") == "session_complete":
+                print(f"    (session complete)")
+                return
+            if msg.get("type") == "process_stopped":
+                return
+        except json.JSONDecodeError:
+            print(f"<<< (raw) {line.decode().strip()}")
 
-def main():
+
+async def main():
     print("Starting agent...")
 
     # Start the agent process
-    proc = subprocess.Popen(
-        ["python", "src/agent.py"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1,  # Line buffered
+    proc = await asyncio.create_subprocess_exec(
+        "python", "src/agent.py",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
     )
 
     try:
         # 1. Send process_start
-        send(proc, {"type": "process_start"})
-        read_responses(proc, timeout=5)
+        await send(proc, {"type": "process_start"})
+        await read_responses(proc, timeout=5)
 
         # 2. Send a message
-        send(proc, {
+        await send(proc, {
             "type": "session_message",
             "text": "What is 2 + 2? Just answer with the number."
         })
-        read_responses(proc, timeout=60)
+        await read_responses(proc, timeout=60)
 
         # 3. Send process_stop
-        send(proc, {"type": "process_stop"})
-        read_responses(proc, timeout=5)
+        await send(proc, {"type": "process_stop"})
+        await read_responses(proc, timeout=5)
 
-    except KeyboardInterrupt:
-        print("\nInterrupted")
     finally:
-        proc.terminate()
-        proc.wait()
+        if proc.returncode is None:
+            proc.terminate()
+        await proc.wait()
 
         # Print any stderr
-        stderr = proc.stderr.read()
+        stderr = await proc.stderr.read()
         if stderr:
-            print(f"\n=== STDERR ===\n{stderr}")
+            print(f"\n=== STDERR ===\n{stderr.decode()}")
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nInterrupted")